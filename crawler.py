@@ -1,17 +1,40 @@
 import asyncio
-import uuid
+import contextlib
+import gzip
+import hashlib
+import logging
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Self
 
+import aiofiles
+import httpx
+import orjson
 from firecrawl import FirecrawlApp
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 from logger import configure_logging, get_logger
 from settings import settings
+from webhook import CrawlWebhookReceiver
 
 configure_logging()
 logger = get_logger("crawler")
 
+# Upper bound on files written at once, keeps large crawls clear of file descriptor limits
+MAX_CONCURRENT_WRITES = 64
+# 1 MiB write buffer so typical HTML pages are flushed in one or two syscalls instead of many 8 KiB ones
+WRITE_BUFFER_SIZE = 1024 * 1024
+# HTML shrinks 5-10x under gzip; level 6 is zlib's default speed/ratio trade-off
+GZIP_COMPRESS_LEVEL = 6
+# Saved files are reported in DEBUG summaries of this many files rather than one line per file
+SAVE_LOG_BATCH_SIZE = 100
+# Crawl jobs started at once by main(); the rest wait their turn to respect Firecrawl rate limits
+MAX_CONCURRENT_CRAWL_STARTS = 4
+# Same retry policy as the SDK applies to 502 responses
+STATUS_REQUEST_RETRIES = 3
+STATUS_RETRY_BACKOFF = 0.5
+# Completed jobs can return many pages of HTML in a single status response
+STATUS_REQUEST_TIMEOUT = 60.0
+
 # --- Pydantic Models for Parameters ---
 
 
@@ -37,11 +60,54 @@ class FirecrawlCrawlParams(BaseModel):
     # include_paths: Optional[List[str]] = Field(default=None, alias="includePaths", description="URL patterns to include")
     # exclude_paths: Optional[List[str]] = Field(default=None, alias="excludePaths", description="URL patterns to exclude")
     scrape_options: FirecrawlScrapeOptions = Field(default_factory=FirecrawlScrapeOptions, alias="scrapeOptions")
+    webhook: Optional[Dict[str, Any]] = Field(default=None, description="Webhook notified about crawl events")
 
     class Config:
         populate_by_name = True  # Allows using either snake_case or alias
 
 
+class CrawlPollingOptions(BaseModel):
+    """Options controlling how often the status of a crawl job is polled."""
+
+    min_delay: float = Field(default=1.0, gt=0, description="Initial delay in seconds, restored on progress")
+    max_delay: float = Field(default=60.0, gt=0, description="Upper bound in seconds for the polling delay")
+    backoff_factor: float = Field(default=1.5, ge=1, description="Delay multiplier applied when no progress is seen")
+    max_rate_limited_retries: int = Field(
+        default=10, ge=0, description="Consecutive HTTP 429 responses tolerated before monitoring stops"
+    )
+
+    @model_validator(mode="after")
+    def check_delay_bounds(self) -> Self:
+        if self.min_delay > self.max_delay:
+            raise ValueError(f"min_delay ({self.min_delay}) must not exceed max_delay ({self.max_delay})")
+        return self
+
+
+class CrawlRateLimitedError(Exception):
+    """Raised when Firecrawl rejects a request with HTTP 429 (Too Many Requests)."""
+
+    def __init__(self, job_id: str, retry_after: float | None = None) -> None:
+        super().__init__(f"Rate limited while checking job {job_id}")
+        self.job_id = job_id
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    """Parses a Retry-After header given in seconds; HTTP-date values are ignored."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+
+def _chunks(items: List[Any], size: int) -> Iterator[List[Any]]:
+    """Yields consecutive slices of items with at most size elements each."""
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
 # --- Crawler Class ---
 
 
@@ -49,125 +115,342 @@ class Crawler:
     """Manages Firecrawl API interactions for crawling websites."""
 
     def __init__(self) -> None:
-        self.app: FirecrawlApp = FirecrawlApp(api_key=settings.firecrawl_api_key)
+        api_key = settings.firecrawl_api_key
+        self.app: FirecrawlApp = FirecrawlApp(api_key=api_key)
+        # Status polling goes straight to the REST API: the SDK blocks on requests and decodes with stdlib
+        # json, while results can carry many pages of HTML per response
+        self.http: httpx.AsyncClient = httpx.AsyncClient(
+            base_url=self.app.api_url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=STATUS_REQUEST_TIMEOUT,
+        )
         logger.info("FirecrawlApp initialized.")
 
+    async def __aenter__(self) -> "Crawler":
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Closes the HTTP client used for status polling."""
+        await self.http.aclose()
+
     async def start_crawl(self, start_url: str, params: FirecrawlCrawlParams) -> str | None:
         """Starts an async crawl job and returns the job ID."""
-        logger.info(
-            f"Starting crawl for: {start_url} with params: {params.model_dump(exclude_none=True, by_alias=True)}"
-        )
+        # Use model_dump to get dict matching API schema (handles aliases); dumped once and reused for the log
+        payload = params.model_dump(exclude_none=True, by_alias=True)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Starting crawl for: %s with params: %s", start_url, payload)
         try:
-            # Use model_dump to get dict matching API schema (handles aliases)
-            crawl_result = self.app.async_crawl_url(
-                url=start_url,
-                params=params.model_dump(exclude_none=True, by_alias=True),
-            )
+            # The SDK call is blocking HTTP, so run it in a worker thread to keep the event loop free
+            crawl_result = await asyncio.to_thread(self.app.async_crawl_url, url=start_url, params=payload)
             job_id = crawl_result.get("id")  # Note: Key is 'id' based on SDK source
             if job_id:
-                logger.info(f"Crawl job started successfully. Job ID: {job_id}")
+                logger.info("Crawl job started successfully. Job ID: %s", job_id)
                 return job_id
             else:
-                logger.error(f"Failed to start crawl job for {start_url}. Response: {crawl_result}")
+                logger.error("Failed to start crawl job for %s. Response: %s", start_url, crawl_result)
                 return None
         except Exception as e:
-            logger.exception(f"Error starting crawl job for {start_url}: {e}")
+            logger.exception("Error starting crawl job for %s: %s", start_url, e)
             return None
 
     async def check_crawl_status(self, job_id: str) -> Dict[str, Any] | None:
-        """Checks the status of a crawl job."""
-        logger.debug(f"Checking status for job ID: {job_id}")
+        """Checks the status of a crawl job.
+
+        The response holds the first page of results only; iter_result_pages walks the rest.
+        Raises CrawlRateLimitedError if Firecrawl answers with HTTP 429, so callers can back off.
+        """
+        logger.debug("Checking status for job ID: %s", job_id)
         try:
-            status_data = self.app.check_crawl_status(job_id)
-            logger.debug(f"Status for job {job_id}: {status_data.get('status')}")
+            status_data = await self._get_status_json(f"/v1/crawl/{job_id}", job_id)
+            logger.debug("Status for job %s: %s", job_id, status_data.get("status"))
             return status_data
+        except CrawlRateLimitedError:
+            raise
         except Exception as e:
-            logger.exception(f"Error checking status for job ID {job_id}: {e}")
+            logger.exception("Error checking status for job ID %s: %s", job_id, e)
             return None
 
+    async def iter_result_pages(self, status_data: Dict[str, Any], job_id: str) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yields the results of a status response one result page at a time.
+
+        The data of status_data comes first and is removed from it. Once the job has completed,
+        the following result pages are fetched by following the API's 'next' links, each only
+        after the previous list was consumed and emptied, so a single page of results is held in memory.
+        Like the SDK's check_crawl_status, a failing page ends the iteration and the pages
+        yielded so far are kept. Raises CrawlRateLimitedError if Firecrawl answers with HTTP 429.
+        """
+        pages = status_data.pop("data", None) or []
+        next_url = status_data.pop("next", None) if status_data.get("status") == "completed" else None
+        fetched_count = len(pages)
+        while True:
+            yield pages
+            if not pages or not next_url:
+                return
+            # Empty the consumed page (the caller's reference included) before fetching the next one
+            pages.clear()
+            try:
+                page = await self._get_status_json(next_url, job_id)
+            except CrawlRateLimitedError:
+                raise
+            except Exception as e:
+                logger.error("Error fetching result page for job %s after %s pages: %s", job_id, fetched_count, e)
+                return
+            pages = page.get("data") or []
+            next_url = page.get("next")
+            fetched_count += len(pages)
+
+    async def _get_status_json(self, url: str, job_id: str) -> Dict[str, Any]:
+        """GETs a crawl status URL (relative to the API or absolute) and decodes the body with orjson."""
+        for attempt in range(STATUS_REQUEST_RETRIES):
+            response = await self.http.get(url)
+            if response.status_code != 502:
+                break
+            await asyncio.sleep(STATUS_RETRY_BACKOFF * (2**attempt))
+
+        if response.status_code == 429:
+            raise CrawlRateLimitedError(job_id, _parse_retry_after(response.headers.get("Retry-After")))
+        response.raise_for_status()
+        return orjson.loads(response.content)
+
     async def save_crawl_results(self, crawl_data: List[Dict[str, Any]], output_dir: str) -> int:
-        """Saves the HTML content from crawl data to files."""
+        """Saves the HTML content from crawl data to files, writing pages concurrently."""
         output_path = Path(output_dir)
         output_path.mkdir(parents=True, exist_ok=True)
-        saved_count = 0
-        logger.info(f"Saving crawl results to directory: {output_dir}")
+        logger.info("Saving crawl results to directory: %s", output_dir)
+
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_WRITES)
+        tasks = [
+            self._write_page(output_path, page_data, i, semaphore)
+            for i, page_data in enumerate(crawl_data)
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        saved_pages = [result for result in results if isinstance(result, tuple)]
+        saved_count = len(saved_pages)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            for batch in _chunks(saved_pages, SAVE_LOG_BATCH_SIZE):
+                (first_url, first_path), (last_url, last_path) = batch[0], batch[-1]
+                logger.debug(
+                    "Saved %d files: %s -> %s ... %s -> %s", len(batch), first_url, first_path, last_url, last_path
+                )
+
+        logger.info("Successfully saved %s HTML files out of %s results.", saved_count, len(crawl_data))
+        return saved_count
 
-        for i, page_data in enumerate(crawl_data):
-            html_content = page_data.get("rawHtml")
-            source_url = page_data.get("metadata", {}).get("sourceURL", f"unknown_url_{i}")
+    async def _write_page(
+        self, output_path: Path, page_data: Dict[str, Any], index: int, semaphore: asyncio.Semaphore
+    ) -> tuple[str, Path] | None:
+        """Writes the HTML of a single crawled page to disk.
 
-            if not html_content:
-                logger.warning(f"No HTML content found for page {i + 1} (URL: {source_url})")
-                continue
+        Returns the (source URL, file path) pair if the file was saved, otherwise None.
+        """
+        html_content = page_data.get("rawHtml")
+        source_url = page_data.get("metadata", {}).get("sourceURL")
 
-            # Generate a unique filename
-            filename = f"page_{uuid.uuid4()}.html"
-            filepath = output_path / filename
+        if not html_content:
+            logger.warning("No HTML content found for page %s (URL: %s)", index + 1, source_url)
+            return None
 
-            try:
-                with open(filepath, "w", encoding="utf-8") as f:
-                    f.write(html_content)
-                logger.debug(f"Saved HTML for {source_url} to {filepath}")
-                saved_count += 1
-            except IOError as e:
-                logger.error(f"Failed to write file {filepath} for {source_url}: {e}")
-            except Exception as e:
-                logger.exception(f"An unexpected error occurred while saving {filepath}: {e}")
+        # Deterministic filename: re-running a crawl rewrites the same files instead of adding new ones.
+        # Pages without a source URL are named after their content instead.
+        name_source = source_url if source_url is not None else html_content
+        name_hash = hashlib.blake2b(name_source.encode("utf-8"), digest_size=8).hexdigest()
+        filename = f"page_{name_hash}.html.gz"
+        filepath = output_path / filename
 
-        logger.info(f"Successfully saved {saved_count} HTML files out of {len(crawl_data)} results.")
-        return saved_count
+        try:
+            # Compress before waiting on the semaphore so only the I/O itself is throttled. zlib releases
+            # the GIL, so pages compress in parallel threads. mtime=0 keeps the output (and its MD5) stable.
+            compressed = await asyncio.to_thread(
+                gzip.compress, html_content.encode("utf-8"), compresslevel=GZIP_COMPRESS_LEVEL, mtime=0
+            )
+            async with semaphore:
+                async with aiofiles.open(filepath, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+                    await f.write(compressed)
+            return source_url, filepath
+        except IOError as e:
+            logger.error("Failed to write file %s for %s: %s", filepath, source_url, e)
+        except Exception as e:
+            logger.exception("An unexpected error occurred while saving %s: %s", filepath, e)
+        return None
 
 
 # --- Main Execution Example (Async) ---
 
 
-async def main(start_url: str, output_dir: str, limit: int = 10):
-    """Main async function to run the crawl process."""
-    crawler = Crawler()
-    crawl_params = FirecrawlCrawlParams(limit=limit)
+class CrawlOutputTracker:
+    """Hands out newly crawled pages for saving, shared by every job writing to one output directory.
 
-    job_id = await crawler.start_crawl(start_url, crawl_params)
+    Overlapping crawls (e.g. /docs/ and /docs/tools) return the same pages, so seen source URLs
+    must be global: each URL is saved exactly once, and no two writes target the same file.
+    """
+
+    def __init__(self) -> None:
+        self.seen_urls: set[str] = set()
+
+    def take_new_pages(self, pages: List[Dict[str, Any]], include_unkeyed: bool) -> List[Dict[str, Any]]:
+        """Returns the pages whose source URL has not been seen yet.
+
+        Pages without a source URL cannot be told apart between polls, so they are only
+        returned when include_unkeyed is set (once the job has finished).
+        """
+        new_pages = []
+        for page in pages:
+            source_url = page.get("metadata", {}).get("sourceURL")
+            if source_url is None:
+                if include_unkeyed:
+                    new_pages.append(page)
+            elif source_url not in self.seen_urls:
+                self.seen_urls.add(source_url)
+                new_pages.append(page)
+        return new_pages
+
+
+async def main(
+    start_urls: List[str],
+    output_dir: str,
+    limit: int = 10,
+    polling: CrawlPollingOptions | None = None,
+    max_concurrent_starts: int = MAX_CONCURRENT_CRAWL_STARTS,
+):
+    """Main async function to run the crawl process.
+
+    Each start URL is crawled as its own Firecrawl job. The jobs run concurrently and share one
+    Crawler; at most max_concurrent_starts crawl requests are in flight at a time to stay within
+    Firecrawl's rate limits.
+
+    If CRAWL_WEBHOOK_URL is configured, a webhook receiver is started and Firecrawl's completion
+    callback ends the wait between polls early; otherwise progress is tracked by polling alone.
+    """
+    polling = polling or CrawlPollingOptions()
+    start_semaphore = asyncio.Semaphore(max_concurrent_starts)
+    tracker = CrawlOutputTracker()
+    async with contextlib.AsyncExitStack() as stack:
+        crawler = await stack.enter_async_context(Crawler())
+        receiver = None
+        if settings.crawl_webhook_url:
+            receiver = await stack.enter_async_context(
+                CrawlWebhookReceiver(settings.crawl_webhook_url, settings.crawl_webhook_port)
+            )
+        async with asyncio.TaskGroup() as tg:
+            for start_url in start_urls:
+                tg.create_task(
+                    _run_crawl(crawler, start_url, output_dir, limit, polling, start_semaphore, tracker, receiver)
+                )
+
+
+async def _save_new_pages(
+    crawler: Crawler,
+    tracker: CrawlOutputTracker,
+    pages: List[Dict[str, Any]],
+    output_dir: str,
+    include_unkeyed: bool,
+) -> int:
+    """Saves the pages not saved by any job yet and returns how many files were written."""
+    new_pages = tracker.take_new_pages(pages, include_unkeyed)
+    if not new_pages:
+        return 0
+    return await crawler.save_crawl_results(new_pages, output_dir)
+
+
+async def _run_crawl(
+    crawler: Crawler,
+    start_url: str,
+    output_dir: str,
+    limit: int,
+    polling: CrawlPollingOptions,
+    start_semaphore: asyncio.Semaphore,
+    tracker: CrawlOutputTracker,
+    receiver: CrawlWebhookReceiver | None = None,
+):
+    """Starts a crawl job, polls it until it finishes and saves pages as they arrive."""
+    crawl_params = FirecrawlCrawlParams(limit=limit, webhook=receiver.webhook_options() if receiver else None)
+
+    async with start_semaphore:
+        job_id = await crawler.start_crawl(start_url, crawl_params)
 
     if not job_id:
-        logger.error("Failed to start crawl job. Exiting.")
+        logger.error("Failed to start crawl job for %s. Skipping it.", start_url)
         return
 
-    logger.info(f"Monitoring crawl job: {job_id} (checking status every 10 seconds)")
-    while True:
-        status_data = await crawler.check_crawl_status(job_id)
-        if not status_data:
-            logger.error(f"Failed to get status for job {job_id}. Exiting monitor loop.")
-            break
-
-        status = status_data.get("status")
-        completed_count = status_data.get("completed", 0)
-        total_count = status_data.get("total", 0)
-        logger.info(f"Job {job_id} status: {status} ({completed_count}/{total_count} pages completed)")
-
-        if status == "completed":
-            logger.info(f"Crawl job {job_id} completed.")
-            crawl_results = status_data.get("data", [])
-            if crawl_results:
-                await crawler.save_crawl_results(crawl_results, output_dir)
+    logger.info("Monitoring crawl job: %s (polling every %s-%s seconds)", job_id, polling.min_delay, polling.max_delay)
+    if receiver:
+        receiver.watch(job_id)
+    delay = polling.min_delay
+    last_completed = 0
+    rate_limited_count = 0
+    # Pages are saved as soon as a status response includes them, rather than all at the end
+    saved_count = 0
+    received_count = 0
+    try:
+        while True:
+            try:
+                status_data = await crawler.check_crawl_status(job_id)
+                if not status_data:
+                    logger.error("Failed to get status for job %s. Exiting monitor loop.", job_id)
+                    break
+
+                status = status_data.get("status")
+                completed_count = status_data.get("completed") or 0
+                total_count = status_data.get("total") or 0
+                logger.info("Job %s status: %s (%s/%s pages completed)", job_id, status, completed_count, total_count)
+
+                # Each result page is saved and dropped before the next one is fetched
+                async for pages in crawler.iter_result_pages(status_data, job_id):
+                    received_count += len(pages)
+                    saved_count += await _save_new_pages(crawler, tracker, pages, output_dir, status == "completed")
+            except CrawlRateLimitedError as e:
+                rate_limited_count += 1
+                if rate_limited_count > polling.max_rate_limited_retries:
+                    logger.error(
+                        "Job %s was rate limited %s times in a row. Exiting monitor loop.", job_id, rate_limited_count
+                    )
+                    break
+                # Back off further and honour the server's Retry-After hint if it asks for longer.
+                # Pages saved before a rate-limited result page are skipped by the tracker on the retry.
+                delay = max(min(delay * polling.backoff_factor, polling.max_delay), e.retry_after or 0.0)
+                logger.warning("Rate limited while checking job %s. Retrying in %.1f seconds.", job_id, delay)
+                await asyncio.sleep(delay)
+                continue
+            rate_limited_count = 0
+
+            if status == "completed":
+                logger.info("Crawl job %s completed. Saved %s pages in total.", job_id, saved_count)
+                if not received_count:
+                    logger.warning("Crawl job %s completed but no data was returned.", job_id)
+                break
+            elif status == "failed":
+                logger.error("Crawl job %s failed. Status data: %s", job_id, status_data)
+                # Optionally check for errors: crawler.app.get_crawl_errors(job_id)
+                break
+            elif status != "scraping":
+                logger.warning("Unknown status '%s' for job %s. Status data: %s", status, job_id, status_data)
+
+            # Poll quickly while pages are coming in, back off while the job is idle
+            if completed_count > last_completed:
+                last_completed = completed_count
+                delay = polling.min_delay
+            else:
+                delay = min(delay * polling.backoff_factor, polling.max_delay)
+            if receiver:
+                # A webhook callback ends the wait early, so completion is picked up without waiting out the delay
+                if await receiver.wait(job_id, timeout=delay):
+                    logger.debug("Woken by webhook callback for job %s", job_id)
             else:
-                logger.warning(f"Crawl job {job_id} completed but no data was returned.")
-            break
-        elif status == "failed":
-            logger.error(f"Crawl job {job_id} failed. Status data: {status_data}")
-            # Optionally check for errors: crawler.app.get_crawl_errors(job_id)
-            break
-        elif status == "scraping":
-            await asyncio.sleep(10)  # Wait before checking status again
-        else:
-            logger.warning(f"Unknown status '{status}' for job {job_id}. Status data: {status_data}")
-            await asyncio.sleep(10)
+                await asyncio.sleep(delay)
+    finally:
+        if receiver:
+            receiver.forget(job_id)
 
 
 if __name__ == "__main__":
     # --- Configuration ---
-    TARGET_START_URL = "https://modelcontextprotocol.io/docs/"
+    TARGET_START_URLS = ["https://modelcontextprotocol.io/docs/"]
     OUTPUT_DIRECTORY = "crawled_html"
-    PAGE_LIMIT = 2  # Max pages to crawl
+    PAGE_LIMIT = 2  # Max pages to crawl per start URL
     # ---------------------
 
-    asyncio.run(main(TARGET_START_URL, OUTPUT_DIRECTORY, limit=PAGE_LIMIT))
+    asyncio.run(main(TARGET_START_URLS, OUTPUT_DIRECTORY, limit=PAGE_LIMIT))
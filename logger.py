@@ -1,9 +1,17 @@
 import logging
 import os
 import sys
+from functools import lru_cache
 
 from settings import settings
 
+# Read once at import; every get_logger() call builds its name from it
+APP_NAME = settings.app_name
+
+# Until configure_logging() installs the console handler, drop records silently rather than falling back
+# to logging.lastResort. Child loggers inherit this, so get_logger() needs no per-logger handler check.
+logging.getLogger(APP_NAME).addHandler(logging.NullHandler())
+
 
 def is_github_actions() -> bool:
     """
@@ -33,10 +41,12 @@ class ConsoleFormatter(logging.Formatter):
     Return it for use
     """
 
+    # Defined once on the class rather than rebuilt for every instance
+    FORMAT = "%(asctime)s - %(levelname)s - %(module)s:%(lineno)d - %(message)s"
+    DATEFMT = "%Y-%m-%d %H:%M:%S"  # Optional: cleaner date format
+
     def __init__(self) -> None:
-        format = "%(asctime)s - %(levelname)s - %(module)s:%(lineno)d - %(message)s"
-        datefmt = "%Y-%m-%d %H:%M:%S"  # Optional: cleaner date format
-        super().__init__(format, datefmt=datefmt)
+        super().__init__(self.FORMAT, datefmt=self.DATEFMT)
 
 
 def configure_logging() -> None:
@@ -48,10 +58,17 @@ def configure_logging() -> None:
     Args:
         enable_console: Whether to enable console logging
     """
+    # Skip collecting per-record attributes that ConsoleFormatter never prints
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    logging.logAsyncioTasks = False
+
     # 1. Get the top-level application logger (NOT the root logger)
-    app_logger = logging.getLogger(settings.app_name)
+    app_logger = logging.getLogger(APP_NAME)
     log_level = logging.DEBUG if settings.debug else logging.INFO
     app_logger.setLevel(log_level)  # Set level on the app logger
+    app_logger.propagate = False  # Records stop here instead of also walking the root logger's handlers
 
     # Remove existing handlers to avoid duplicates
     for handler in app_logger.handlers[:]:
@@ -93,12 +110,13 @@ def configure_logging() -> None:
     logging.getLogger("logfire").setLevel(logging.ERROR)
 
 
+@lru_cache(maxsize=None)
 def get_logger(name: str) -> logging.Logger:
     """
     Get a logger instance with the given name.
 
     This does NOT configure the logging system - it just returns a logger.
-    Call configure_logging() first at application startup.
+    Call configure_logging() first at application startup. Loggers are cached per name.
 
     Args:
         The name of the logger.
@@ -106,12 +124,4 @@ def get_logger(name: str) -> logging.Logger:
     Returns:
         A configured logger instance
     """
-    name = f"{settings.app_name}.{name}"
-    logger = logging.getLogger(name)
-
-    # Add a null handler if no handlers are configured yet
-    # This prevents "No handlers could be found" warnings
-    if not logger.handlers and not logging.root.handlers:
-        logger.addHandler(logging.NullHandler())
-
-    return logger
+    return logging.getLogger(f"{APP_NAME}.{name}")
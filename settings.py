@@ -59,6 +59,19 @@ class Settings(BaseSettings):
         description="Account ID for R2 storage",
     )
 
+    # Firecrawl webhooks (optional). When unset, crawl progress is tracked by polling only.
+    crawl_webhook_url: str | None = Field(
+        default=None,
+        alias="CRAWL_WEBHOOK_URL",
+        description="Public URL at which Firecrawl can reach the local webhook receiver",
+    )
+
+    crawl_webhook_port: int = Field(
+        default=8787,
+        alias="CRAWL_WEBHOOK_PORT",
+        description="Local port the webhook receiver listens on",
+    )
+
     # Debug
     debug: bool | None = Field(
         default=None,
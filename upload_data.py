@@ -1,7 +1,15 @@
+import hashlib
+import json
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
 import boto3
-from botocore.exceptions import ClientError
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 
 from logger import configure_logging, get_logger
 from settings import settings
@@ -12,86 +20,239 @@ logger = get_logger("upload_data")  # Using logger.py
 
 # Constants
 CRAWL_OUTPUT_DIR = Path(__file__).parent / "crawled_html"
+# Caches the MD5 of each local file keyed by mtime and size, so unchanged files are not re-hashed
+UPLOAD_MANIFEST_PATH = CRAWL_OUTPUT_DIR / ".upload_manifest.json"
+MAX_UPLOAD_WORKERS = 32
+# One transfer manager uploads every file through a shared thread pool. HTML pages are far below
+# the multipart threshold, so each file goes up as a single PUT.
+UPLOAD_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=64 * 1024 * 1024,
+    max_concurrency=MAX_UPLOAD_WORKERS,
+    use_threads=True,
+)
+# Files above this size are hashed with hashlib.file_digest instead of through mmap
+LARGE_FILE_HASH_THRESHOLD = 4 * 1024 * 1024
+# Keep more pooled connections than workers so concurrent requests reuse open TLS connections, and let
+# botocore back off adaptively when R2 throttles
+R2_CLIENT_CONFIG = Config(
+    max_pool_connections=64,
+    retries={"max_attempts": 5, "mode": "adaptive"},
+    tcp_keepalive=True,
+    connect_timeout=5,
+    read_timeout=30,
+)
+
+
+@lru_cache
+def get_r2_client(endpoint_url: str, access_key_id: str, secret_access_key: str):
+    """
+    Returns the R2 client for the given endpoint and credentials, creating it on first use.
+
+    Cached per argument set, so repeated calls with the same settings reuse one client and keep
+    its connection pool warm across uploads.
+    """
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint_url,
+        aws_access_key_id=access_key_id,
+        aws_secret_access_key=secret_access_key,
+        region_name="auto",  # Standard R2 setting
+        config=R2_CLIENT_CONFIG,
+    )
+
+
+def load_upload_manifest(manifest_path: Path) -> dict[str, dict]:
+    """Loads the upload manifest, returning an empty one if it is missing or unreadable."""
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable upload manifest %s: %s", manifest_path, e)
+        return {}
+
+
+def save_upload_manifest(manifest_path: Path, manifest: dict[str, dict]) -> None:
+    """Writes the upload manifest, logging instead of failing the upload run on errors."""
+    try:
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    except OSError as e:
+        logger.warning("Failed to write upload manifest %s: %s", manifest_path, e)
+
+
+def compute_md5(file_path: str, size: int) -> str:
+    """
+    Returns the MD5 hexdigest of a file without a Python-level read loop.
+
+    Small files are memory-mapped so hashlib walks the (usually page-cached) pages directly;
+    large files go through hashlib.file_digest.
+    """
+    with open(file_path, "rb") as f:
+        if size > LARGE_FILE_HASH_THRESHOLD:
+            return hashlib.file_digest(f, "md5").hexdigest()
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return hashlib.md5(mm).hexdigest()
+        except ValueError:
+            # Empty files cannot be mapped
+            return hashlib.md5(b"").hexdigest()
+
+
+def get_local_md5(file_path: str, manifest: dict[str, dict]) -> str:
+    """
+    Returns the MD5 hexdigest of a local file.
+
+    The manifest entry is reused while the file's mtime and size are unchanged; otherwise the
+    file is hashed and the entry refreshed.
+    """
+    stat = os.stat(file_path)
+    name = os.path.basename(file_path)
+    cached = manifest.get(name)
+    if cached and cached.get("mtime_ns") == stat.st_mtime_ns and cached.get("size") == stat.st_size:
+        return cached["md5"]
+
+    md5 = compute_md5(file_path, stat.st_size)
+    manifest[name] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "md5": md5}
+    return md5
+
+
+def is_already_uploaded(s3_client, bucket: str, object_key: str, local_md5: str) -> bool:
+    """
+    Checks whether the object in R2 already holds content with the given MD5.
+
+    R2 reports the MD5 of the object as its ETag for single-part uploads, so a match means
+    the upload can be skipped.
+    """
+    try:
+        head = s3_client.head_object(Bucket=bucket, Key=object_key)
+    except ClientError:
+        # Most likely a 404 - the object does not exist yet
+        return False
+    except BotoCoreError as e:
+        # Connection errors or timeouts once retries run out; let the upload attempt report the failure
+        logger.warning("Could not check %s in R2, attempting the upload anyway: %s", object_key, e)
+        return False
+    return head["ETag"].strip('"') == local_md5
+
+
+def needs_upload(s3_client, bucket: str, object_key: str, file_path: str, manifest: dict[str, dict]) -> bool:
+    """Returns True unless R2 already holds an identical copy of the local file."""
+    try:
+        local_md5 = get_local_md5(file_path, manifest)
+    except OSError:
+        # Let the upload attempt report the problem
+        return True
+    return not is_already_uploaded(s3_client, bucket, object_key, local_md5)
 
 
 def upload_files_to_r2():
     """
-    Lists HTML files in the crawled_html directory and uploads them to R2.
+    Lists gzip-compressed HTML files in the crawled_html directory and uploads them to R2.
     """
+    # Read settings once; the values are reused by every per-file call below
     endpoint_url = f"https://{settings.r2_account_id}.r2.cloudflarestorage.com"
-    # Reading bucket name and keys from settings
-    if (
-        not endpoint_url
-        or not settings.r2_bucket_name
-        or not settings.r2_access_key_id
-        or not settings.r2_secret_access_key
-    ):
+    bucket = settings.r2_bucket_name
+    access_key_id = settings.r2_access_key_id
+    secret_access_key = settings.r2_secret_access_key
+    # Check that the bucket name and keys are all configured
+    if not endpoint_url or not bucket or not access_key_id or not secret_access_key:
         logger.error(
             "Missing necessary R2 configuration (Account ID, Bucket Name, Access Key, or Secret Key). Cannot proceed."
         )
         return
 
     if not CRAWL_OUTPUT_DIR.is_dir():
-        logger.error(f"Directory not found: {CRAWL_OUTPUT_DIR}")
+        logger.error("Directory not found: %s", CRAWL_OUTPUT_DIR)
         return
 
-    logger.info(f"Connecting to R2 bucket: {settings.r2_bucket_name} at {endpoint_url}")
+    logger.info("Connecting to R2 bucket: %s at %s", bucket, endpoint_url)
     try:
         # Using client is generally preferred for explicit operations
-        s3_client = boto3.client(
-            "s3",
-            endpoint_url=endpoint_url,
-            aws_access_key_id=settings.r2_access_key_id,
-            aws_secret_access_key=settings.r2_secret_access_key,
-            region_name="auto",  # Standard R2 setting
-        )
+        s3_client = get_r2_client(endpoint_url, access_key_id, secret_access_key)
         logger.info("Successfully created R2 client.")
     except Exception as e:
-        logger.error(f"Failed to create R2 client: {e}")
+        logger.error("Failed to create R2 client: %s", e)
         return
 
-    logger.info(f"Scanning directory for HTML files: {CRAWL_OUTPUT_DIR}")
+    logger.info("Scanning directory for HTML files: %s", CRAWL_OUTPUT_DIR)
     try:
-        files_to_upload = list(CRAWL_OUTPUT_DIR.glob("*.html"))
+        # scandir entries carry the file type from the directory listing, so filtering needs no extra stat calls
+        with os.scandir(CRAWL_OUTPUT_DIR) as entries:
+            files_to_upload = [
+                entry.path
+                for entry in entries
+                if entry.name.endswith(".html.gz") and entry.is_file(follow_symlinks=False)
+            ]
     except OSError as e:
-        logger.error(f"Error accessing directory {CRAWL_OUTPUT_DIR}: {e}")
+        logger.error("Error accessing directory %s: %s", CRAWL_OUTPUT_DIR, e)
         return
 
     if not files_to_upload:
-        logger.warning(f"No HTML files found in {CRAWL_OUTPUT_DIR}. Nothing to upload.")
+        logger.warning("No HTML files found in %s. Nothing to upload.", CRAWL_OUTPUT_DIR)
         return
 
-    logger.info(f"Found {len(files_to_upload)} HTML files to upload.")
+    logger.info("Found %s HTML files to upload.", len(files_to_upload))
+    manifest = load_upload_manifest(UPLOAD_MANIFEST_PATH)
 
     success_count = 0
+    skipped_count = 0
     failure_count = 0
 
-    for file_path in files_to_upload:
-        object_key = file_path.name  # Use the filename as the key in R2
-        logger.debug(f"Attempting to upload {file_path} to {settings.r2_bucket_name}/{object_key}")
-        try:
-            # upload_file handles opening/reading the file
-            s3_client.upload_file(
-                Filename=str(file_path),
-                Bucket=settings.r2_bucket_name,
-                Key=object_key,
-                ExtraArgs={"ContentType": "text/html"},  # Set content type
+    # Use the filename without ".gz" as the key; R2 stores the compressed bytes and reports Content-Encoding
+    object_keys = [os.path.basename(file_path).removesuffix(".gz") for file_path in files_to_upload]
+
+    # HEAD requests are small but latency-bound, so check all files concurrently
+    # boto3 clients are thread-safe, so one client is shared by all workers. Each worker only
+    # touches the manifest entry of its own file.
+    with ThreadPoolExecutor(max_workers=MAX_UPLOAD_WORKERS) as pool:
+        upload_flags = list(
+            pool.map(
+                lambda key, path: needs_upload(s3_client, bucket, key, path, manifest),
+                object_keys,
+                files_to_upload,
             )
-            logger.info(f"Successfully uploaded {object_key}")
-            success_count += 1
-        except ClientError as e:
-            logger.error(f"Failed to upload {object_key}: {e}")
-            failure_count += 1
-        except FileNotFoundError:
-            logger.error(f"File not found during upload attempt: {file_path}")
-            failure_count += 1
-        except Exception as e:
-            logger.error(f"An unexpected error occurred uploading {object_key}: {e}")
-            failure_count += 1
+        )
+
+    with create_transfer_manager(s3_client, UPLOAD_TRANSFER_CONFIG) as transfer_manager:
+        futures = {}
+        for file_path, object_key, upload_needed in zip(files_to_upload, object_keys, upload_flags):
+            if not upload_needed:
+                logger.debug("Skipping %s, unchanged since last upload", object_key)
+                skipped_count += 1
+                continue
+            logger.debug("Attempting to upload %s to %s/%s", file_path, bucket, object_key)
+            futures[object_key] = transfer_manager.upload(
+                file_path,
+                bucket,
+                object_key,
+                extra_args={"ContentType": "text/html", "ContentEncoding": "gzip"},  # Set content type and encoding
+            )
+
+        for object_key, future in futures.items():
+            try:
+                future.result()
+                logger.info("Successfully uploaded %s", object_key)
+                success_count += 1
+            except ClientError as e:
+                logger.error("Failed to upload %s: %s", object_key, e)
+                failure_count += 1
+            except FileNotFoundError:
+                logger.error("File not found during upload attempt: %s", object_key)
+                failure_count += 1
+            except Exception as e:
+                logger.error("An unexpected error occurred uploading %s: %s", object_key, e)
+                failure_count += 1
+
+    # Drop entries for files that no longer exist locally
+    local_names = {os.path.basename(file_path) for file_path in files_to_upload}
+    save_upload_manifest(UPLOAD_MANIFEST_PATH, {name: entry for name, entry in manifest.items() if name in local_names})
 
     logger.info("----- Upload Summary -----")
-    logger.info(f"Successful uploads: {success_count}")
-    logger.info(f"Failed uploads:    {failure_count}")
+    logger.info("Successful uploads: %s", success_count)
+    logger.info("Skipped uploads:   %s", skipped_count)
+    logger.info("Failed uploads:    %s", failure_count)
     logger.info("--------------------------")
 
 
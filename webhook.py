@@ -0,0 +1,104 @@
+import asyncio
+import secrets
+from urllib.parse import urlparse
+
+import orjson
+from aiohttp import web
+
+from logger import get_logger
+
+logger = get_logger("webhook")
+
+# Header Firecrawl echoes back on every callback, used to reject requests that did not come from our crawls
+TOKEN_HEADER = "X-Webhook-Token"
+
+
+class CrawlWebhookReceiver:
+    """
+    Receives Firecrawl webhook callbacks and wakes up whoever is waiting on the job.
+
+    Runs a small aiohttp server on the given port. Each callback sets the asyncio.Event of
+    the job it refers to, so a monitor loop can block on wait() instead of sleeping.
+    """
+
+    def __init__(self, public_url: str, port: int, host: str = "0.0.0.0") -> None:
+        self.public_url = public_url
+        self.port = port
+        self.host = host
+        self.token = secrets.token_urlsafe(16)
+        self._events: dict[str, asyncio.Event] = {}
+        self._runner: web.AppRunner | None = None
+
+    async def __aenter__(self) -> "CrawlWebhookReceiver":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.stop()
+
+    async def start(self) -> None:
+        """Starts serving callbacks on the path of the public URL."""
+        app = web.Application()
+        app.router.add_post(urlparse(self.public_url).path or "/", self._handle_callback)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info("Webhook receiver listening on %s:%s for %s", self.host, self.port, self.public_url)
+
+    async def stop(self) -> None:
+        """Stops the server."""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def webhook_options(self) -> dict:
+        """Returns the webhook settings to send with a crawl request."""
+        return {
+            "url": self.public_url,
+            "headers": {TOKEN_HEADER: self.token},
+            "events": ["completed", "failed"],
+        }
+
+    async def wait(self, job_id: str, timeout: float) -> bool:
+        """
+        Waits until a callback for the job arrives or the timeout expires.
+
+        Returns:
+            bool: True if woken by a callback, False on timeout
+        """
+        event = self._events.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+            return True
+        except TimeoutError:
+            return False
+        finally:
+            event.clear()
+
+    def watch(self, job_id: str) -> None:
+        """Starts accepting callbacks for a job; callbacks for unknown jobs are ignored."""
+        self._events.setdefault(job_id, asyncio.Event())
+
+    def forget(self, job_id: str) -> None:
+        """Drops the event of a job that is no longer monitored."""
+        self._events.pop(job_id, None)
+
+    async def _handle_callback(self, request: web.Request) -> web.Response:
+        if request.headers.get(TOKEN_HEADER) != self.token:
+            logger.warning("Rejected webhook callback with a missing or invalid token from %s", request.remote)
+            return web.Response(status=401)
+        try:
+            payload = orjson.loads(await request.read())
+        except orjson.JSONDecodeError:
+            logger.warning("Rejected webhook callback with an invalid JSON body")
+            return web.Response(status=400)
+        if not isinstance(payload, dict):
+            logger.warning("Rejected webhook callback whose JSON body is not an object")
+            return web.Response(status=400)
+
+        job_id = payload.get("id")
+        logger.debug("Webhook callback for job %s: %s", job_id, payload.get("type"))
+        event = self._events.get(job_id) if isinstance(job_id, str) else None
+        if event:
+            event.set()
+        return web.Response(status=200)